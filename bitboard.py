@@ -0,0 +1,33 @@
+"""Win detection on 9-bit boards, shared by the AI, the offline manager and the server.
+
+Each player's marks are one int with bit i set for board cell i. Kept free of
+numpy so the server can import it.
+"""
+
+# Winning lines as board index triples
+WIN_LINES = (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),  # rows
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),  # columns
+    (0, 4, 8), (2, 4, 6)              # diagonals
+)
+
+# Winning lines as 9-bit masks, bit i set for board cell i
+WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,  # rows
+    0b001001001, 0b010010010, 0b100100100,  # columns
+    0b100010001, 0b001010100                # diagonals
+)
+FULL_BOARD = 0b111111111
+
+# Every 9-bit board is precomputed once, so a win test is a single index
+IS_WIN = tuple(any(bits & mask == mask for mask in WIN_MASKS) for bits in range(FULL_BOARD + 1))
+
+def winner_from_bits(bits1: int, bits2: int) -> int:
+    """Return 1 or 2 for a win, 3 for a draw and 0 while the game continues"""
+    if IS_WIN[bits1]:
+        return 1
+    if IS_WIN[bits2]:
+        return 2
+    if bits1 | bits2 == FULL_BOARD:
+        return 3
+    return 0
@@ -1,12 +1,53 @@
+import os
 import random
+from operator import mul
 import numpy as np
 import pickle
-import matplotlib.pyplot as plt
-from collections import deque
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Fallback when numba is not installed: leave the function as plain Python"""
+        return lambda func: func
+
+# Boards are encoded as base-3 integers, giving one Q-table row per possible board
+N_STATES = 3 ** 9
+STATE_WEIGHTS = tuple(3 ** i for i in range(9))
+
+def _build_empty_q_table() -> np.ndarray:
+    cells = (np.arange(N_STATES)[:, None] // np.array(STATE_WEIGHTS)) % 3
+    q_table = np.zeros((N_STATES, 9), dtype=np.float32)
+    # Occupied cells are never legal moves; -inf keeps them out of max/argmax
+    q_table[cells != 0] = -np.inf
+    return q_table
+
+EMPTY_Q_TABLE = _build_empty_q_table()
+
+Q_TABLE_PATH = 'ai_qtable.npy'
+LEGACY_Q_TABLE_PATH = 'ai_qtable.pkl'  # pickled table written by older versions
+TRAINING_DATA_PATH = 'ai_training_data.npy'
+LEGACY_TRAINING_DATA_PATH = 'ai_training_data.pkl'  # pickled reward list written by older versions
+
+@njit(cache=True)
+def _update_q_values(q_table, states, moves, episode_ends, rewards, learning_rate, discount_factor):
+    """Backward sweep over each queued episode in order; each state's row max feeds the state before it"""
+    start = 0
+    for episode in range(len(episode_ends)):
+        end = episode_ends[episode]
+        reward = rewards[episode]
+        max_next_q = 0.0
+        for i in range(end - 1, start - 1, -1):
+            state = states[i]
+            move = moves[i]
+            q_table[state, move] = (1 - learning_rate) * q_table[state, move] + \
+                                   learning_rate * (reward + discount_factor * max_next_q)
+            max_next_q = q_table[state].max()
+        start = end
 
 class TicTacToeAI:
     def __init__(self):
-        self.q_table = {}
+        self.q_table = EMPTY_Q_TABLE.copy()  # q_table[state_key, position] = Q-value
         self.epsilon = 1.0  # Exploration rate
         self.epsilon_min = 0.01
         self.epsilon_decay = 0.995
@@ -14,51 +55,113 @@ class TicTacToeAI:
         self.discount_factor = 0.95
         self.reward_history = []  # Track rewards per episode
         self.move_history = []
+        self.update_batch_size = 1  # Episodes queued before they are applied to the Q-table in one call
+        self._pending_episodes = []  # (move_history, reward) awaiting flush_q_updates
+        self._best_moves = {}  # state_key -> greedy move, valid until the Q-table changes
+        self._rng = random.Random()  # Per-agent generator; far cheaper per call than np.random
         
-    def get_state_key(self, board: list) -> str:
-        return ''.join(map(str, board))
+    def get_state_key(self, board) -> int:
+        return sum(map(mul, board, STATE_WEIGHTS))
         
-    def make_move(self, board: list, player_number: int) -> int:
-        state_key = self.get_state_key(board)
-        empty_positions = [i for i, value in enumerate(board) if value == 0]
+    def set_q_table(self, q_table):
+        """Install a Q-table, converting the legacy dict-of-dicts format.
+        Replace the table through here rather than by assignment so cached greedy moves are dropped.
+        """
+        if isinstance(q_table, dict):
+            converted = EMPTY_Q_TABLE.copy()
+            for state, q_values in q_table.items():
+                state_key = self.get_state_key(map(int, state))
+                for position, value in q_values.items():
+                    converted[state_key, position] = value
+            q_table = converted
+        self.q_table = q_table
+        self._best_moves.clear()
         
-        if not empty_positions:
+    def copy_q_table_from(self, other: 'TicTacToeAI'):
+        """Snapshot another agent's Q-table into this agent's existing buffer, without allocating"""
+        other.flush_q_updates()
+        np.copyto(self.q_table, other.q_table)
+        self._best_moves.clear()
+        
+    def load_q_table(self, mmap_mode=None) -> bool:
+        """Load the saved Q-table, converting a legacy pickle to .npy on first use.
+        With mmap_mode the file is mapped instead of read, so only touched rows are paged in.
+        """
+        if not os.path.exists(Q_TABLE_PATH):
+            if not os.path.exists(LEGACY_Q_TABLE_PATH):
+                return False
+            with open(LEGACY_Q_TABLE_PATH, 'rb') as f:
+                self.set_q_table(pickle.load(f))
+            self.save_q_table()
+            
+        self.set_q_table(np.load(Q_TABLE_PATH, mmap_mode=mmap_mode))
+        return True
+        
+    def save_q_table(self):
+        self.flush_q_updates()
+        np.save(Q_TABLE_PATH, np.asarray(self.q_table, dtype=np.float32))
+        
+    def state_count(self) -> int:
+        """Number of states with at least one learned Q-value"""
+        learned = np.isfinite(self.q_table) & (self.q_table != 0)
+        return int(np.count_nonzero(learned.any(axis=1)))
+        
+    def make_move(self, board, player_number: int) -> int:
+        if 0 not in board:
             return -1
             
-        if state_key not in self.q_table:
-            self.q_table[state_key] = {pos: 0 for pos in empty_positions}
+        state_key = self.get_state_key(board)
             
-        if np.random.random() < self.epsilon:
-            move = random.choice(empty_positions)
+        if self._rng.random() < self.epsilon:
+            move = self._rng.choice([i for i, value in enumerate(board) if value == 0])
             self.move_history.append((state_key, move, 0))
             return move
             
-        q_values = self.q_table[state_key]
-        move = max(q_values, key=q_values.get)
+        move = self._best_moves.get(state_key)
+        if move is None:
+            move = self._best_moves[state_key] = int(self.q_table[state_key].argmax())
         self.move_history.append((state_key, move, 1))
         return move
         
     def update_q_values(self, reward: float):
-        for i in range(len(self.move_history)-1, -1, -1):
-            state, move, _ = self.move_history[i]
-            next_state = self.move_history[i+1][0] if i < len(self.move_history)-1 else None
-            max_next_q = max(self.q_table[next_state].values()) if next_state and next_state in self.q_table else 0
-            
-            self.q_table[state][move] = (1 - self.learning_rate) * self.q_table[state][move] + \
-                                       self.learning_rate * (reward + self.discount_factor * max_next_q)
+        if self.move_history:
+            self._pending_episodes.append((self.move_history, reward))
+            if len(self._pending_episodes) >= self.update_batch_size:
+                self.flush_q_updates()
             
         self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay)
         self.move_history = []
         self.reward_history.append(reward)  # Store the reward
         
+    def flush_q_updates(self):
+        """Apply every queued episode to the Q-table in a single compiled call"""
+        if not self._pending_episodes:
+            return
+        states = []
+        moves = []
+        episode_ends = []
+        for history, _ in self._pending_episodes:
+            states.extend(state for state, _, _ in history)
+            moves.extend(move for _, move, _ in history)
+            episode_ends.append(len(states))
+        rewards = np.array([reward for _, reward in self._pending_episodes], dtype=np.float64)
+        self._pending_episodes = []
+        self._best_moves.clear()
+        _update_q_values(self.q_table, np.array(states, dtype=np.int64), np.array(moves, dtype=np.int64),
+                         np.array(episode_ends, dtype=np.int64), rewards,
+                         self.learning_rate, self.discount_factor)
+            
     def save_training_data(self):
-        with open('ai_training_data.pkl', 'wb') as f:
-            pickle.dump(self.reward_history, f)
+        # Rewards are only ever -1, 0, 0.5 or 1, so float32 stores them exactly
+        np.save(TRAINING_DATA_PATH, np.asarray(self.reward_history, dtype=np.float32))
             
     def plot_training(self):
         if not self.reward_history:
             return
             
+        # Deferred: matplotlib is only needed when a plot is requested
+        import matplotlib.pyplot as plt
+        
         plt.figure(figsize=(12, 6))
         episodes = range(1, len(self.reward_history) + 1)
         
@@ -67,10 +170,11 @@ class TicTacToeAI:
         
         # Plot moving average
         window_size = 50
-        moving_avg = []
-        for i in range(len(self.reward_history)):
-            start = max(0, i - window_size)
-            moving_avg.append(np.mean(self.reward_history[start:i+1]))
+        rewards = np.asarray(self.reward_history, dtype=np.float64)
+        cumsum = np.concatenate(([0.0], np.cumsum(rewards)))
+        ends = np.arange(1, len(rewards) + 1)
+        starts = np.maximum(0, ends - 1 - window_size)
+        moving_avg = (cumsum[ends] - cumsum[starts]) / (ends - starts)
         
         plt.plot(episodes, moving_avg, color='red', 
                 label=f'{window_size}-Episode Moving Average')
@@ -1,45 +1,164 @@
 import socket
+import selectors
 import json
 import threading
 import logging
-from typing import Dict, List, Optional, Callable
+import protocol
+from typing import Dict, List, Optional, Callable, Tuple
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
 
 logger = logging.getLogger('TicTacToe-Client')
 
+# Moves are tiny JSON lines answered by the opponent, so disable Nagle to send them immediately
+DEFAULT_SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    (socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20),
+    (socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20),
+]
+# Linux only: acknowledge immediately instead of waiting to piggyback on a reply
+if hasattr(socket, 'TCP_QUICKACK'):
+    DEFAULT_SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1))
+
+# Outbound messages have a fixed schema; they are encoded once per game and only the position is spliced in
+_MOVE_PREFIX_TEMPLATE = '{"t":%d,"session_id":%%s,"player":%%d,"position":' % protocol.MOVE
+_RESTART_TEMPLATE = '{"t":%d,"session_id":%%s}\n' % protocol.RESTART
+
+# Handlers of these messages ignore the payload, so they are recognised by prefix and never parsed
+_PREFIX_CODES = {}
+for _code in (protocol.WELCOME, protocol.WAITING, protocol.OPPONENT_DISCONNECTED):
+    for _prefix in ('{"t":%d,', '{"t": %d,', '{"t":%d}'):
+        _PREFIX_CODES[(_prefix % _code).encode('utf-8')] = _code
+    for _prefix in ('{"type":"%s"', '{"type": "%s"'):
+        _PREFIX_CODES[(_prefix % protocol.TYPE_NAMES[_code]).encode('utf-8')] = _code
+_PREFIXES = tuple(_PREFIX_CODES)
+
+class ClientReactor:
+    """A single selector thread that services the sockets of every connected client"""
+    
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.thread = None
+        
+    def register(self, client: 'TicTacToeClient'):
+        with self.lock:
+            self.selector.register(client.sock, selectors.EVENT_READ, client)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='TicTacToe-Client-Reactor')
+                self.thread.daemon = True
+                self.thread.start()
+                
+    def unregister(self, client: 'TicTacToeClient'):
+        with self.lock:
+            try:
+                self.selector.unregister(client.sock)
+            except (KeyError, ValueError):
+                pass
+                
+    def run(self):
+        try:
+            while True:
+                with self.lock:
+                    # Exit when idle; the next register() starts a fresh thread
+                    if not self.selector.get_map():
+                        self.thread = None
+                        return
+                try:
+                    events = self.selector.select(timeout=0.5)
+                except (OSError, ValueError):
+                    continue
+                for key, _ in events:
+                    key.data.on_readable()
+        finally:
+            # However the loop ended, let the next register() start a replacement thread
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.thread = None
+
+_reactor = ClientReactor()
+
 class TicTacToeClient:
-    def __init__(self, host: str = 'localhost', port: int = 5555):
+    def __init__(self, host: str = 'localhost', port: int = 5555,
+                 socket_options: Optional[List[Tuple[int, int, int]]] = None):
         self.host = host
         self.port = port
+        self.socket_options = DEFAULT_SOCKET_OPTIONS if socket_options is None else socket_options
         self.sock = None
         self.connected = False
         self.session_id = None
         self.player_number = None
         self.game_state = None
-        self.receiver_thread = None
-        self.callbacks = {
-            'on_connect': [],
-            'on_waiting': [],
-            'on_game_start': [],
-            'on_update': [],
-            'on_game_end': [],
-            'on_error': [],
-            'on_disconnect': [],
-            'on_opponent_disconnect': [],
-            'on_game_restart': []
+        self._move_prefix = b''
+        self._restart_frame = b''
+        # Reads land directly after any partial line already held; only the leftover tail is moved
+        self._recv_buf = bytearray(65536)
+        self._recv_view = memoryview(self._recv_buf)
+        self._recv_len = 0
+        # Frames queued by concurrent senders go out in one sendall by whichever thread is flushing
+        self._write_buffer = bytearray()
+        self._write_lock = threading.Lock()
+        self._write_done = threading.Condition(self._write_lock)
+        self._flushing = False
+        # Batches are numbered as the flusher takes them, so queued senders can wait for their own
+        self._batches_taken = 0
+        self._batches_sent = 0
+        self._batches_failed = 0
+        # One list per event, so emitting skips the dict lookup and *args packing
+        self.on_connect_callbacks: List[Callable] = []
+        self.on_waiting_callbacks: List[Callable] = []
+        self.on_game_start_callbacks: List[Callable] = []
+        self.on_update_callbacks: List[Callable] = []
+        self.on_game_end_callbacks: List[Callable] = []
+        self.on_error_callbacks: List[Callable] = []
+        self.on_disconnect_callbacks: List[Callable] = []
+        self.on_opponent_disconnect_callbacks: List[Callable] = []
+        self.on_game_restart_callbacks: List[Callable] = []
+        self._callback_lists = {
+            'on_connect': self.on_connect_callbacks,
+            'on_waiting': self.on_waiting_callbacks,
+            'on_game_start': self.on_game_start_callbacks,
+            'on_update': self.on_update_callbacks,
+            'on_game_end': self.on_game_end_callbacks,
+            'on_error': self.on_error_callbacks,
+            'on_disconnect': self.on_disconnect_callbacks,
+            'on_opponent_disconnect': self.on_opponent_disconnect_callbacks,
+            'on_game_restart': self.on_game_restart_callbacks
         }
+        # Handlers indexed by protocol message code; the client never receives MOVE or RESTART
+        self._handlers = (
+            self._handle_welcome,
+            self._handle_waiting,
+            self._handle_game_start,
+            self._handle_update,
+            self._handle_game_end,
+            self._handle_error,
+            self._handle_opponent_disconnected,
+            self._handle_game_restart,
+            None,
+            None
+        )
         
     def connect(self):
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            for level, option, value in self.socket_options:
+                self.sock.setsockopt(level, option, value)
             self.sock.settimeout(10)
             self.sock.connect((self.host, self.port))
             self.sock.settimeout(None)
             self.connected = True
-            logger.info(f"Connected to server at {self.host}:{self.port}")
+            logger.info("Connected to server at %s:%s", self.host, self.port)
             
-            self.receiver_thread = threading.Thread(target=self.receive_messages)
-            self.receiver_thread.daemon = True
-            self.receiver_thread.start()
+            self._recv_len = 0
+            _reactor.register(self)
             return True
         except socket.timeout:
             logger.error("Connection attempt timed out")
@@ -48,13 +167,14 @@ class TicTacToeClient:
             logger.error("Connection refused. Is the server running?")
             return False
         except Exception as e:
-            logger.error(f"Connection error: {e}")
+            logger.error("Connection error: %s", e)
             return False
             
     def disconnect(self):
         if self.connected:
             self.connected = False
             if self.sock:
+                _reactor.unregister(self)
                 try:
                     self.sock.close()
                 except:
@@ -62,107 +182,198 @@ class TicTacToeClient:
             logger.info("Disconnected from server")
             
     def send_message(self, message: Dict):
+        frame = bytearray(json_dumps(message))
+        frame.append(0x0A)  # newline terminator, sent in the same segment
+        return self._send_frame(frame)
+        
+    def _send_frame(self, frame: bytes):
         if not self.connected:
             logger.error("Not connected to server")
             return False
             
+        with self._write_lock:
+            self._write_buffer += frame
+            batch = self._batches_taken + 1
+            if self._flushing:
+                # Another thread is sending; report how our batch fared once it is done
+                while self._batches_sent < batch and self._batches_failed < batch:
+                    self._write_done.wait()
+                return self._batches_sent >= batch
+            self._flushing = True
+            
         try:
-            self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
-            return True
+            while True:
+                with self._write_lock:
+                    if not self._write_buffer:
+                        self._flushing = False
+                        return True
+                    data, self._write_buffer = self._write_buffer, bytearray()
+                    self._batches_taken += 1
+                self.sock.sendall(data)
+                with self._write_lock:
+                    self._batches_sent = self._batches_taken
+                    self._write_done.notify_all()
         except Exception as e:
-            logger.error(f"Error sending message: {e}")
-            self.connected = False
-            self._trigger_callback('on_disconnect')
-            return False
+            with self._write_lock:
+                # Frames still buffered are dropped with the failed batch
+                self._write_buffer.clear()
+                self._batches_taken += 1
+                self._batches_failed = self._batches_taken
+                self._flushing = False
+                self._write_done.notify_all()
+                sent = self._batches_sent >= batch
+            logger.error("Error sending message: %s", e)
+            self._connection_lost()
+            return sent
             
-    def receive_messages(self):
-        buffer = ""
-        while self.connected:
-            try:
-                data = self.sock.recv(1024).decode('utf-8')
-                if not data:
-                    logger.info("Server closed the connection")
-                    self.connected = False
-                    self._trigger_callback('on_disconnect')
-                    break
-                    
-                buffer += data
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if line:
-                        try:
-                            message = json.loads(line)
-                            self.process_message(message)
-                        except json.JSONDecodeError:
-                            logger.error(f"Invalid JSON received: {line}")
-                            
-            except ConnectionResetError:
+    def on_readable(self):
+        """Called on the reactor thread when the socket has data; never blocks"""
+        if self._recv_len == len(self._recv_buf):
+            # A single line filled the buffer; the view must be released before the bytearray can grow
+            self._recv_view.release()
+            self._recv_buf += bytearray(len(self._recv_buf))
+            self._recv_view = memoryview(self._recv_buf)
+            
+        try:
+            nbytes = self.sock.recv_into(self._recv_view[self._recv_len:])
+        except ConnectionResetError:
+            if self.connected:
                 logger.error("Connection reset by server")
-                self.connected = False
-                self._trigger_callback('on_disconnect')
-                break
+                self._connection_lost()
+            return
+        except Exception as e:
+            if self.connected:
+                logger.error("Error receiving messages: %s", e)
+                self._connection_lost()
+            return
+            
+        if not nbytes:
+            logger.info("Server closed the connection")
+            self._connection_lost()
+            return
+            
+        buffer = self._recv_buf
+        view = self._recv_view
+        end = self._recv_len + nbytes
+        start = 0
+        # Only complete lines are decoded; a partial line stays in the buffer
+        idx = buffer.find(b'\n', 0, end)
+        while idx >= 0:
+            line = bytes(view[start:idx])
+            start = idx + 1
+            # A message that breaks its handler drops only this client, never the shared reactor thread
+            try:
+                if line.startswith(_PREFIXES):
+                    self.process_prefixed_message(line)
+                elif line:
+                    self.process_message(json_loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                logger.error("Invalid JSON received: %r", line)
             except Exception as e:
-                logger.error(f"Error receiving messages: {e}")
-                self.connected = False
-                self._trigger_callback('on_disconnect')
-                break
+                logger.error("Error processing message %r: %s", line, e)
+                self._connection_lost()
+                return
+            idx = buffer.find(b'\n', start, end)
+            
+        remaining = end - start
+        if start and remaining:
+            buffer[:remaining] = bytes(view[start:end])
+        self._recv_len = remaining
+            
+    def _connection_lost(self):
+        self.connected = False
+        _reactor.unregister(self)
+        self._emit(self.on_disconnect_callbacks, 'on_disconnect')
                 
     def process_message(self, message: Dict):
-        message_type = message.get('type')
+        code = protocol.message_code(message)
+        if code is not None and 0 <= code < len(self._handlers):
+            handler = self._handlers[code]
+            if handler:
+                handler(message)
+            
+    def process_prefixed_message(self, line: bytes):
+        for prefix, code in _PREFIX_CODES.items():
+            if line.startswith(prefix):
+                self._handlers[code]({'t': code})
+                return
+            
+    def _read_game_state(self, message: Dict) -> Optional[Dict]:
+        """Extract a message's game state, freezing the board into bytes once on receipt"""
+        game_state = message.get('game_state')
+        if game_state and game_state.get('board') is not None:
+            game_state['board'] = bytes(game_state['board'])
+        return game_state
+        
+    def _handle_welcome(self, message: Dict):
+        self._emit(self.on_connect_callbacks, 'on_connect')
+        
+    def _handle_waiting(self, message: Dict):
+        self._emit(self.on_waiting_callbacks, 'on_waiting')
+        
+    def _handle_game_start(self, message: Dict):
+        self.session_id = message.get('session_id')
+        self.player_number = message.get('player')
+        self.game_state = self._read_game_state(message)
+        session_json = json.dumps(self.session_id)
+        self._move_prefix = (_MOVE_PREFIX_TEMPLATE % (session_json, self.player_number)).encode('utf-8')
+        self._restart_frame = (_RESTART_TEMPLATE % session_json).encode('utf-8')
+        self._emit2(self.on_game_start_callbacks, 'on_game_start', self.player_number, self.game_state)
+        
+    def _handle_update(self, message: Dict):
+        self.game_state = self._read_game_state(message)
+        self._emit1(self.on_update_callbacks, 'on_update', self.game_state)
+        
+    def _handle_game_end(self, message: Dict):
+        winner = message.get('winner')
+        self.game_state = self._read_game_state(message)
+        self._emit2(self.on_game_end_callbacks, 'on_game_end', winner, self.game_state)
+        
+    def _handle_error(self, message: Dict):
+        error_msg = message.get('message')
+        self._emit1(self.on_error_callbacks, 'on_error', error_msg)
         
-        if message_type == 'welcome':
-            self._trigger_callback('on_connect')
-        elif message_type == 'waiting':
-            self._trigger_callback('on_waiting')
-        elif message_type == 'game_start':
-            self.session_id = message.get('session_id')
-            self.player_number = message.get('player')
-            self.game_state = message.get('game_state')
-            self._trigger_callback('on_game_start', self.player_number, self.game_state)
-        elif message_type == 'update':
-            self.game_state = message.get('game_state')
-            self._trigger_callback('on_update', self.game_state)
-        elif message_type == 'game_end':
-            winner = message.get('winner')
-            self.game_state = message.get('game_state')
-            self._trigger_callback('on_game_end', winner, self.game_state)
-        elif message_type == 'error':
-            error_msg = message.get('message')
-            self._trigger_callback('on_error', error_msg)
-        elif message_type == 'opponent_disconnected':
-            self._trigger_callback('on_opponent_disconnect')
-        elif message_type == 'game_restart':
-            self.game_state = message.get('game_state')
-            self._trigger_callback('on_game_restart', self.game_state)
+    def _handle_opponent_disconnected(self, message: Dict):
+        self._emit(self.on_opponent_disconnect_callbacks, 'on_opponent_disconnect')
+        
+    def _handle_game_restart(self, message: Dict):
+        self.game_state = self._read_game_state(message)
+        self._emit1(self.on_game_restart_callbacks, 'on_game_restart', self.game_state)
             
     def make_move(self, position: int):
         if not self.connected or not self.session_id:
             return False
-        return self.send_message({
-            'type': 'move',
-            'session_id': self.session_id,
-            'player': self.player_number,
-            'position': position
-        })
+        return self._send_frame(self._move_prefix + b'%d}\n' % position)
         
     def request_restart(self):
         if not self.connected or not self.session_id:
             return False
-        return self.send_message({
-            'type': 'restart',
-            'session_id': self.session_id
-        })
+        return self._send_frame(self._restart_frame)
         
     def register_callback(self, event_type: str, callback: Callable):
-        if event_type in self.callbacks:
-            self.callbacks[event_type].append(callback)
-            return True
-        return False
+        callbacks = self._callback_lists.get(event_type)
+        if callbacks is None:
+            return False
+        callbacks.append(callback)
+        return True
         
-    def _trigger_callback(self, event_type: str, *args):
-        if event_type in self.callbacks:
-            for callback in self.callbacks[event_type]:
-                try:
-                    callback(*args)
-                except Exception as e:
-                    logger.error(f"Error in callback {event_type}: {e}")
+    def _emit(self, callbacks: List[Callable], event_type: str):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Error in callback %s: %s", event_type, e)
+                
+    def _emit1(self, callbacks: List[Callable], event_type: str, arg):
+        for callback in callbacks:
+            try:
+                callback(arg)
+            except Exception as e:
+                logger.error("Error in callback %s: %s", event_type, e)
+                
+    def _emit2(self, callbacks: List[Callable], event_type: str, arg1, arg2):
+        for callback in callbacks:
+            try:
+                callback(arg1, arg2)
+            except Exception as e:
+                logger.error("Error in callback %s: %s", event_type, e)
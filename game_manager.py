@@ -1,122 +1,204 @@
-import os
 import time
 import random
-import pickle
 import threading
-from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 from game_ai import TicTacToeAI
+from bitboard import winner_from_bits
 
 class AIGameManager:
-    def __init__(self):
+    def __init__(self, show_thinking_delay: bool = False):
         self.ai = TicTacToeAI()
         self.load_ai_qtable()
         self.game_state = None
         self.player_number = 1  # Human is always player 1
+        self._bits = [0, 0, 0]  # Per-player bitboards, indexed by player number
+        # One list per event, so emitting skips the dict lookup and *args packing
+        self.on_game_start_callbacks: List[Callable] = []
+        self.on_update_callbacks: List[Callable] = []
+        self.on_game_end_callbacks: List[Callable] = []
+        self.on_game_restart_callbacks: List[Callable] = []
         self.callbacks = {
-            'on_game_start': [],
-            'on_update': [],
-            'on_game_end': [],
-            'on_game_restart': []
+            'on_game_start': self.on_game_start_callbacks,
+            'on_update': self.on_update_callbacks,
+            'on_game_end': self.on_game_end_callbacks,
+            'on_game_restart': self.on_game_restart_callbacks
         }
-        self.ai_thinking = False
-        self.ai_thread = None
+        # Serializes game-state transitions between the GUI thread and the AI worker;
+        # reentrant because callbacks fired under it may call back into the manager
+        self._lock = threading.RLock()
+        self._ai_busy = threading.Event()
+        self._game_id = 0  # Bumped on every (re)start so a stale AI turn is discarded
+        # One reusable worker computes every AI turn instead of a thread per move
+        self._ai_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ai')
+        # With the delay on, AI moves are held until the caller's loop calls poll_ai_move()
+        self.show_thinking_delay = show_thinking_delay
+        # A computed AI move waits here until its thinking delay has elapsed
+        self._pending_move = None
+        self._ai_ready_at = 0.0
         self.training_mode = False
 
     def load_ai_qtable(self):
-        if os.path.exists('ai_qtable.pkl'):
-            try:
-                with open('ai_qtable.pkl', 'rb') as f:
-                    self.ai.q_table = pickle.load(f)
+        try:
+            # Copy-on-write mapping: rows are paged in on demand and training never touches the file
+            if self.ai.load_q_table(mmap_mode='c'):
                 self.ai.epsilon = 0  # Exploit learned policy
                 print("✅ Loaded trained AI Q-table.")
-            except Exception as e:
-                print(f"⚠️ Failed to load Q-table: {e}")
+        except Exception as e:
+            print(f"⚠️ Failed to load Q-table: {e}")
+
+    @property
+    def ai_thinking(self) -> bool:
+        return self._ai_busy.is_set()
 
     def start_game(self):
-        self.game_state = {
-            'board': [0] * 9,
-            'current_player': 1,
-            'game_active': True
-        }
-        self._trigger_callback('on_game_start', self.player_number, self.game_state)
+        with self._lock:
+            self._game_id += 1
+            self.game_state = {
+                'board': bytearray(9),  # 0: empty, 1: human, 2: AI
+                'current_player': 1,
+                'game_active': True
+            }
+            self._bits = [0, 0, 0]
+            self._pending_move = None
+            self._ai_busy.clear()
+            self._emit2(self.on_game_start_callbacks, 'on_game_start', self.player_number, self.game_state)
 
     def restart_game(self):
-        self.start_game()
-        self._trigger_callback('on_game_restart', self.game_state)
+        with self._lock:
+            self.start_game()
+            self._emit1(self.on_game_restart_callbacks, 'on_game_restart', self.game_state)
 
     def make_move(self, position: int) -> bool:
-        if (not self.game_state or 
-            not self.game_state['game_active'] or 
-            self.game_state['current_player'] != self.player_number or
-            self.game_state['board'][position] != 0):
-            return False
-
-        self.game_state['board'][position] = self.player_number
-
-        winner = self._check_winner()
-        if winner:
-            self.game_state['game_active'] = False
-            self._trigger_callback('on_game_end', winner, self.game_state)
-            if self.training_mode:
-                reward = 1 if winner == 2 else (-1 if winner == 1 else 0)
-                self.ai.update_q_values(reward)
-            return True
+        with self._lock:
+            game_state = self.game_state
+            if (not game_state or 
+                not game_state['game_active'] or 
+                game_state['current_player'] != self.player_number or
+                self._ai_busy.is_set()):
+                return False
+            board = game_state['board']
+            if board[position] != 0:
+                return False
+
+            board[position] = self.player_number
+            self._bits[self.player_number] |= 1 << position
 
-        self.game_state['current_player'] = 2
-        self._trigger_callback('on_update', self.game_state)
+            winner = self._check_winner()
+            if winner:
+                game_state['game_active'] = False
+                self._emit2(self.on_game_end_callbacks, 'on_game_end', winner, game_state)
+                self._learn_from_result(winner)
+                return True
 
-        if not self.ai_thinking:
-            self.ai_thinking = True
-            self.ai_thread = threading.Thread(target=self._ai_make_move)
-            self.ai_thread.daemon = True
-            self.ai_thread.start()
+            game_state['current_player'] = 2
+            self._emit1(self.on_update_callbacks, 'on_update', game_state)
 
-        return True
+            self._ai_busy.set()
+            if self.training_mode:
+                # Training games run at full speed: no worker hand-off and no thinking delay
+                self._apply_ai_move(self.ai.make_move(board, 2))
+            else:
+                self._ai_pool.submit(self._ai_make_move, self._game_id)
 
-    def _ai_make_move(self):
-        time.sleep(random.uniform(0.5, 1.5))
-        board_copy = self.game_state['board'].copy()
-        ai_move = self.ai.make_move(board_copy, 2)
+            return True
 
-        if ai_move >= 0 and self.game_state['game_active']:
-            self.game_state['board'][ai_move] = 2
+    def fast_step(self, position: int) -> Tuple[int, bytearray]:
+        """Play the human move and the AI reply synchronously, for headless simulation.
+        No worker thread, thinking delay or callbacks are involved. Returns (winner, board).
+        """
+        with self._lock:
+            game_state = self.game_state
+            if (not game_state or 
+                not game_state['game_active'] or 
+                game_state['current_player'] != self.player_number or
+                game_state['board'][position] != 0):
+                raise ValueError(f"Illegal move: {position}")
+            board = game_state['board']
+            bits = self._bits
+
+            board[position] = self.player_number
+            bits[self.player_number] |= 1 << position
             winner = self._check_winner()
+            if not winner:
+                ai_move = self.ai.make_move(board, 2)
+                board[ai_move] = 2
+                bits[2] |= 1 << ai_move
+                winner = self._check_winner()
+
             if winner:
-                self.game_state['game_active'] = False
-                self._trigger_callback('on_game_end', winner, self.game_state)
-                if self.training_mode:
-                    reward = 1 if winner == 2 else (-1 if winner == 1 else 0)
-                    self.ai.update_q_values(reward)
+                game_state['game_active'] = False
+                self._learn_from_result(winner)
+            return winner, board
+
+    def _ai_make_move(self, game_id: int):
+        with self._lock:
+            if game_id != self._game_id:
+                return  # The game was restarted while this turn was queued
+            # The lock keeps the board still, so the AI reads it in place without a snapshot
+            ai_move = self.ai.make_move(self.game_state['board'], 2)
+            if self.show_thinking_delay:
+                self._ai_ready_at = time.monotonic() + random.uniform(0.5, 1.5)
+                self._pending_move = ai_move
             else:
-                self.game_state['current_player'] = 1
-                self._trigger_callback('on_update', self.game_state)
+                self._apply_ai_move(ai_move)
+
+    def poll_ai_move(self):
+        """Apply a delayed AI move once its deadline has passed; called from the GUI loop"""
+        if self._pending_move is not None and time.monotonic() >= self._ai_ready_at:
+            with self._lock:
+                ai_move = self._pending_move
+                if ai_move is not None:
+                    self._pending_move = None
+                    self._apply_ai_move(ai_move)
+
+    def _apply_ai_move(self, ai_move: int):
+        """Place the AI's move; the caller holds the lock"""
+        game_state = self.game_state
+        if ai_move >= 0 and game_state['game_active']:
+            board = game_state['board']
+            board[ai_move] = 2
+            self._bits[2] |= 1 << ai_move
+            winner = self._check_winner()
+            if winner:
+                game_state['game_active'] = False
+                self._emit2(self.on_game_end_callbacks, 'on_game_end', winner, game_state)
+                self._learn_from_result(winner)
+            else:
+                game_state['current_player'] = 1
+                self._emit1(self.on_update_callbacks, 'on_update', game_state)
 
-        self.ai_thinking = False
+        self._ai_busy.clear()
+
+    def _learn_from_result(self, winner: int):
+        if self.training_mode:
+            reward = 1 if winner == 2 else (-1 if winner == 1 else 0)
+            self.ai.update_q_values(reward)
 
     def _check_winner(self) -> int:
-        board = self.game_state['board']
-        for i in range(0, 9, 3):
-            if board[i] != 0 and board[i] == board[i+1] == board[i+2]:
-                return board[i]
-        for i in range(3):
-            if board[i] != 0 and board[i] == board[i+3] == board[i+6]:
-                return board[i]
-        if board[0] != 0 and board[0] == board[4] == board[8]:
-            return board[0]
-        if board[2] != 0 and board[2] == board[4] == board[6]:
-            return board[2]
-        if 0 not in board:
-            return 3
-        return 0
+        """Return 1 or 2 for a win, 3 for a draw and 0 while the game continues"""
+        return winner_from_bits(self._bits[1], self._bits[2])
+
+    def shutdown(self):
+        self._ai_pool.shutdown(wait=False)
 
     def register_callback(self, event_type: str, callback: Callable):
+        if not callable(callback):
+            raise TypeError(f"Callback for {event_type} is not callable: {callback!r}")
         if event_type in self.callbacks:
             self.callbacks[event_type].append(callback)
 
-    def _trigger_callback(self, event_type: str, *args):
-        if event_type in self.callbacks:
-            for callback in self.callbacks[event_type]:
-                try:
-                    callback(*args)
-                except Exception as e:
-                    print(f"Error in callback {event_type}: {e}")
+    def _emit1(self, callbacks: List[Callable], event_type: str, arg):
+        # Each callback is guarded on its own so one failure does not skip the rest
+        for callback in callbacks:
+            try:
+                callback(arg)
+            except Exception as e:
+                print(f"Error in callback {event_type}: {e}")
+
+    def _emit2(self, callbacks: List[Callable], event_type: str, arg1, arg2):
+        for callback in callbacks:
+            try:
+                callback(arg1, arg2)
+            except Exception as e:
+                print(f"Error in callback {event_type}: {e}")
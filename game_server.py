@@ -1,29 +1,78 @@
 import socket
-import threading
+import selectors
 import json
 import logging
+import protocol
+from bitboard import winner_from_bits
 from typing import Dict, List, Tuple, Optional
 
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('TicTacToe-Server')
 
+# Messages without variable fields are encoded once instead of on every send
+_WELCOME_FRAME = json_dumps(protocol.with_legacy_type({
+    't': protocol.WELCOME,
+    'message': 'Connected to Tic Tac Toe server'
+})) + b'\n'
+_WAITING_FRAME = json_dumps(protocol.with_legacy_type({'t': protocol.WAITING, 'message': 'Waiting for opponent'})) + b'\n'
+_OPPONENT_DISCONNECTED_FRAME = json_dumps(protocol.with_legacy_type({
+    't': protocol.OPPONENT_DISCONNECTED,
+    'message': 'Your opponent has disconnected'
+})) + b'\n'
+
+LISTEN_BACKLOG = 128
+# Moves are tiny JSON lines, so accepted connections disable Nagle and send them immediately
+CLIENT_SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+class ClientConnection:
+    """Read state for one client socket serviced by the server's selector loop"""
+    
+    __slots__ = ('sock', 'addr', 'buffer', 'view', 'pending', 'outbuf', 'session_id', 'player_number')
+    
+    def __init__(self, sock: socket.socket, addr):
+        self.sock = sock
+        self.addr = addr
+        # Reads land after any partial line already held in the buffer
+        self.buffer = bytearray(65536)
+        self.view = memoryview(self.buffer)
+        self.pending = 0
+        self.outbuf = bytearray()  # Bytes the socket could not take yet, flushed when it turns writable
+        # Set when the client is paired into a game session
+        self.session_id = None
+        self.player_number = None
+
 class GameSession:
     """Manages a game session between two players"""
     
-    def __init__(self, session_id: str, player1_conn, player1_addr):
+    __slots__ = ('session_id', 'player1', 'player2', 'current_player', 'board', 'bits', 'game_active', 'winner')
+    
+    def __init__(self, session_id: str, player1: ClientConnection):
         self.session_id = session_id
-        self.player1 = (player1_conn, player1_addr)
+        self.player1 = player1
         self.player2 = None
         self.current_player = 1  # Player 1 starts
-        self.board = [0] * 9  # 0: empty, 1: player1, 2: player2
+        self.board = bytearray(9)  # 0: empty, 1: player1, 2: player2
+        self.bits = [0, 0, 0]  # Per-player bitboards, indexed by player number
         self.game_active = True
-        logger.info(f"Game session {session_id} created")
+        self.winner = 0  # Result of check_winner after the last move, so it is computed once per move
+        logger.info("Game session %s created", session_id)
         
-    def add_player2(self, player2_conn, player2_addr):
+    def add_player2(self, player2: ClientConnection):
         """Add the second player to the game session"""
-        self.player2 = (player2_conn, player2_addr)
-        logger.info(f"Player 2 joined session {self.session_id}")
+        self.player2 = player2
+        logger.info("Player 2 joined session %s", self.session_id)
         
     def is_full(self) -> bool:
         """Check if the session has two players"""
@@ -42,13 +91,14 @@ class GameSession:
             
         # Update the board
         self.board[position] = player
+        self.bits[player] |= 1 << position
         
         # Switch player turn
         self.current_player = 3 - player  # Toggle between 1 and 2
         
         # Check for win or draw
-        winner = self.check_winner()
-        if winner:
+        self.winner = self.check_winner()
+        if self.winner:
             self.game_active = False
             
         return True
@@ -60,45 +110,25 @@ class GameSession:
             1 or 2 for player 1 or 2 win
             3 for draw
         """
-        # Check rows
-        for i in range(0, 9, 3):
-            if self.board[i] != 0 and self.board[i] == self.board[i+1] == self.board[i+2]:
-                return self.board[i]
-                
-        # Check columns
-        for i in range(3):
-            if self.board[i] != 0 and self.board[i] == self.board[i+3] == self.board[i+6]:
-                return self.board[i]
-                
-        # Check diagonals
-        if self.board[0] != 0 and self.board[0] == self.board[4] == self.board[8]:
-            return self.board[0]
-            
-        if self.board[2] != 0 and self.board[2] == self.board[4] == self.board[6]:
-            return self.board[2]
-            
-        # Check for draw (board full)
-        if 0 not in self.board:
-            return 3
-            
-        return 0  # Game continues
+        return winner_from_bits(self.bits[1], self.bits[2])
         
     def get_game_state(self) -> Dict:
         """Return the current game state as a dictionary"""
-        winner = self.check_winner()
         return {
             'session_id': self.session_id,
-            'board': self.board,
+            'board': list(self.board),
             'current_player': self.current_player,
             'game_active': self.game_active,
-            'winner': winner
+            'winner': self.winner
         }
         
     def reset_game(self):
         """Reset the game to start a new round"""
-        self.board = [0] * 9
+        self.board = bytearray(9)
+        self.bits = [0, 0, 0]
         self.current_player = 1
         self.game_active = True
+        self.winner = 0
 
 class TicTacToeServer:
     """Server for Tic Tac Toe game"""
@@ -112,27 +142,29 @@ class TicTacToeServer:
         self.waiting_player = None
         self.next_session_id = 1
         self.running = True
+        # One selector services the listening socket and every client, instead of a thread per client
+        self.selector = selectors.DefaultSelector()
         
     def start(self):
         """Start the server"""
         try:
             self.sock.bind((self.host, self.port))
-            self.sock.listen(5)
-            self.sock.settimeout(1.0)  # Add timeout to allow for clean shutdown
-            logger.info(f"Server started on {self.host}:{self.port}")
+            self.sock.listen(LISTEN_BACKLOG)
+            self.sock.setblocking(False)
+            self.selector.register(self.sock, selectors.EVENT_READ, None)
+            logger.info("Server started on %s:%s", self.host, self.port)
             
             while self.running:
-                try:
-                    client_sock, client_addr = self.sock.accept()
-                    logger.info(f"New connection from {client_addr}")
-                    client_thread = threading.Thread(target=self.handle_client, args=(client_sock, client_addr))
-                    client_thread.daemon = True
-                    client_thread.start()
-                except socket.timeout:
-                    continue
-                except Exception as e:
-                    if self.running:
-                        logger.error(f"Error accepting connection: {e}")
+                # The timeout lets the loop notice a clean shutdown
+                for key, events in self.selector.select(timeout=1.0):
+                    conn = key.data
+                    if conn is None:
+                        self.accept_client()
+                        continue
+                    if events & selectors.EVENT_WRITE:
+                        self.write_client(conn)
+                    if events & selectors.EVENT_READ and conn.sock.fileno() >= 0:
+                        self.read_client(conn)
         except KeyboardInterrupt:
             logger.info("Server shutting down...")
         finally:
@@ -142,97 +174,147 @@ class TicTacToeServer:
         """Clean up resources when shutting down"""
         self.running = False
         # Close all client connections
-        for session_id, session in list(self.sessions.items()):
-            try:
-                session.player1[0].close()
-                if session.player2:
-                    session.player2[0].close()
-            except:
-                pass
+        for key in list(self.selector.get_map().values()):
+            if key.data is not None:
+                try:
+                    key.data.sock.close()
+                except:
+                    pass
+        self.selector.close()
         # Close server socket
         self.sock.close()
         logger.info("Server shut down completed")
+        
+    def accept_client(self):
+        """Accept a pending connection on the listening socket"""
+        try:
+            client_sock, client_addr = self.sock.accept()
+        except BlockingIOError:
+            return
+        except Exception as e:
+            if self.running:
+                logger.error("Error accepting connection: %s", e)
+            return
+        logger.info("New connection from %s", client_addr)
+        self.handle_client(client_sock, client_addr)
             
     def handle_client(self, client_sock: socket.socket, client_addr):
-        """Handle a client connection"""
-        client_sock.settimeout(None)  # No timeout for client sockets
+        """Handle a new client connection"""
+        client_sock.setblocking(False)  # The selector loop must never block on one client
+        for level, option, value in CLIENT_SOCKET_OPTIONS:
+            client_sock.setsockopt(level, option, value)
+        conn = ClientConnection(client_sock, client_addr)
+        self.selector.register(client_sock, selectors.EVENT_READ, conn)
         try:
             # Send welcome message
-            self.send_message(client_sock, {'type': 'welcome', 'message': 'Connected to Tic Tac Toe server'})
+            self.send_frame(conn, _WELCOME_FRAME)
             
             # If no waiting player, this client becomes the waiting player
             if self.waiting_player is None:
-                self.waiting_player = (client_sock, client_addr)
-                self.send_message(client_sock, {'type': 'waiting', 'message': 'Waiting for opponent'})
+                self.waiting_player = conn
+                self.send_frame(conn, _WAITING_FRAME)
             else:
                 # Create a new game session with waiting player and this client
                 session_id = f"game_{self.next_session_id}"
                 self.next_session_id += 1
                 
-                waiting_sock, waiting_addr = self.waiting_player
-                session = GameSession(session_id, waiting_sock, waiting_addr)
-                session.add_player2(client_sock, client_addr)
+                waiting = self.waiting_player
+                session = GameSession(session_id, waiting)
+                session.add_player2(conn)
                 self.sessions[session_id] = session
+                waiting.session_id, waiting.player_number = session_id, 1
+                conn.session_id, conn.player_number = session_id, 2
                 
-                # Inform both players the game is starting
-                self.send_message(waiting_sock, {
-                    'type': 'game_start',
+                # Inform both players the game is starting; the messages differ only in the player number
+                game_state = session.get_game_state()
+                self.send_message(waiting, {
+                    't': protocol.GAME_START,
                     'session_id': session_id,
                     'player': 1,
-                    'game_state': session.get_game_state()
+                    'game_state': game_state
                 })
                 
-                self.send_message(client_sock, {
-                    'type': 'game_start',
+                self.send_message(conn, {
+                    't': protocol.GAME_START,
                     'session_id': session_id,
                     'player': 2,
-                    'game_state': session.get_game_state()
+                    'game_state': game_state
                 })
                 
                 self.waiting_player = None
-                
-            # Main client loop
-            buffer = ""
-            while self.running:
+        except Exception as e:
+            logger.error("Error handling client %s: %s", client_addr, e)
+            self.close_client(conn)
+            
+    def read_client(self, conn: ClientConnection):
+        """Read whatever a client has sent and process every complete message"""
+        if conn.pending == len(conn.buffer):
+            # A single line filled the buffer; release the view so the bytearray can grow
+            conn.view.release()
+            conn.buffer += bytearray(len(conn.buffer))
+            conn.view = memoryview(conn.buffer)
+            
+        try:
+            nbytes = conn.sock.recv_into(conn.view[conn.pending:])
+        except BlockingIOError:
+            return
+        except ConnectionResetError:
+            logger.error("Connection reset by client %s", conn.addr)
+            self.close_client(conn)
+            return
+        except Exception as e:
+            logger.error("Error receiving data from %s: %s", conn.addr, e)
+            self.close_client(conn)
+            return
+            
+        if not nbytes:
+            # Connection closed by client
+            self.close_client(conn)
+            return
+            
+        buffer = conn.buffer
+        view = conn.view
+        end = conn.pending + nbytes
+        start = 0
+        
+        # Process complete messages
+        idx = buffer.find(b'\n', 0, end)
+        while idx >= 0:
+            line = bytes(view[start:idx])
+            start = idx + 1
+            if line:
                 try:
-                    data = client_sock.recv(1024).decode('utf-8')
-                    if not data:
-                        # Connection closed by client
-                        break
-                        
-                    buffer += data
-                    
-                    # Process complete messages
-                    while '\n' in buffer:
-                        line, buffer = buffer.split('\n', 1)
-                        if line:
-                            try:
-                                message = json.loads(line)
-                                self.process_message(message, client_sock, client_addr)
-                            except json.JSONDecodeError:
-                                logger.error(f"Invalid JSON from {client_addr}: {line}")
-                except ConnectionResetError:
-                    logger.error(f"Connection reset by client {client_addr}")
-                    break
+                    message = json_loads(line)
+                    self.process_message(message, conn)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    logger.error("Invalid JSON from %s: %r", conn.addr, line)
                 except Exception as e:
-                    logger.error(f"Error receiving data from {client_addr}: {e}")
-                    break
-                
-        except Exception as e:
-            logger.error(f"Error handling client {client_addr}: {e}")
-        finally:
-            # Handle disconnection
-            self.handle_disconnect(client_sock, client_addr)
-            try:
-                client_sock.close()
-            except:
-                pass
+                    logger.error("Error handling message from %s: %s", conn.addr, e)
+                    self.close_client(conn)
+                    return
+            idx = buffer.find(b'\n', start, end)
+            
+        conn.pending = end - start
+        if start and conn.pending:
+            buffer[:conn.pending] = bytes(view[start:end])
+            
+    def close_client(self, conn: ClientConnection):
+        """Unregister a client, handle its disconnection and close its socket"""
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            return  # Already closed
+        self.handle_disconnect(conn)
+        try:
+            conn.sock.close()
+        except:
+            pass
             
-    def process_message(self, message: Dict, client_sock: socket.socket, client_addr):
+    def process_message(self, message: Dict, conn: ClientConnection):
         """Process a message from a client"""
-        message_type = message.get('type')
+        message_type = protocol.message_code(message)
         
-        if message_type == 'move':
+        if message_type == protocol.MOVE:
             session_id = message.get('session_id')
             player = message.get('player')
             position = message.get('position')
@@ -240,97 +322,112 @@ class TicTacToeServer:
             if session_id in self.sessions:
                 session = self.sessions[session_id]
                 
-                # Validate this client is in this session
-                is_player1 = session.player1[0] == client_sock
-                is_player2 = session.player2 and session.player2[0] == client_sock
-                
-                if (is_player1 and player == 1) or (is_player2 and player == 2):
+                # Validate this client is this player of this session
+                if conn.session_id == session_id and conn.player_number == player:
                     # Process the move
                     if session.make_move(player, position):
-                        # Move successful, broadcast the updated state
+                        # Move successful, broadcast the updated state; each frame is encoded once for both players
                         game_state = session.get_game_state()
-                        self.send_message(session.player1[0], {
-                            'type': 'update',
-                            'game_state': game_state
-                        })
-                        self.send_message(session.player2[0], {
-                            'type': 'update',
+                        frame = self.encode_message({
+                            't': protocol.UPDATE,
                             'game_state': game_state
                         })
                         
                         # Check if game ended
-                        winner = session.check_winner()
+                        winner = game_state['winner']
                         if winner:
-                            result_message = {
-                                'type': 'game_end',
+                            frame += self.encode_message({
+                                't': protocol.GAME_END,
                                 'winner': winner,
                                 'game_state': game_state
-                            }
-                            self.send_message(session.player1[0], result_message)
-                            self.send_message(session.player2[0], result_message)
+                            })
+                        self.broadcast(session, frame)
                     else:
                         # Invalid move
-                        self.send_message(client_sock, {
-                            'type': 'error',
+                        self.send_message(conn, {
+                            't': protocol.ERROR,
                             'message': 'Invalid move'
                         })
                 else:
-                    self.send_message(client_sock, {
-                        'type': 'error',
+                    self.send_message(conn, {
+                        't': protocol.ERROR,
                         'message': 'Not your turn or not in this session'
                     })
                     
-        elif message_type == 'restart':
+        elif message_type == protocol.RESTART:
             session_id = message.get('session_id')
             if session_id in self.sessions:
                 session = self.sessions[session_id]
                 session.reset_game()
                 
-                restart_message = {
-                    'type': 'game_restart',
+                self.broadcast(session, self.encode_message({
+                    't': protocol.GAME_RESTART,
                     'game_state': session.get_game_state()
-                }
-                self.send_message(session.player1[0], restart_message)
-                self.send_message(session.player2[0], restart_message)
+                }))
                 
-    def send_message(self, client_sock: socket.socket, message: Dict):
+    def encode_message(self, message: Dict) -> bytes:
+        """Serialize a message into a newline-terminated frame"""
+        return json_dumps(protocol.with_legacy_type(message)) + b'\n'
+        
+    def send_message(self, conn: ClientConnection, message: Dict):
         """Send a message to a client"""
+        self.send_frame(conn, self.encode_message(message))
+        
+    def send_frame(self, conn: ClientConnection, frame: bytes):
+        """Send an already encoded frame to a client, queueing whatever the socket cannot take now"""
+        if conn.outbuf:
+            # Earlier bytes are still queued; keep the order and let write_client drain them
+            conn.outbuf += frame
+            return
+        try:
+            sent = conn.sock.send(frame)
+        except BlockingIOError:
+            sent = 0
+        except Exception as e:
+            logger.error("Error sending message: %s", e)
+            return
+        if sent < len(frame):
+            conn.outbuf += frame[sent:]
+            self.selector.modify(conn.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, conn)
+            
+    def write_client(self, conn: ClientConnection):
+        """Flush queued output once the client socket is writable again"""
         try:
-            client_sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            sent = conn.sock.send(conn.outbuf)
+        except BlockingIOError:
+            return
         except Exception as e:
-            logger.error(f"Error sending message: {e}")
+            logger.error("Error sending message: %s", e)
+            self.close_client(conn)
+            return
+        del conn.outbuf[:sent]
+        if not conn.outbuf:
+            self.selector.modify(conn.sock, selectors.EVENT_READ, conn)
             
-    def handle_disconnect(self, client_sock: socket.socket, client_addr):
+    def broadcast(self, session: GameSession, frame: bytes):
+        """Send an already encoded frame to both players of a session"""
+        self.send_frame(session.player1, frame)
+        self.send_frame(session.player2, frame)
+            
+    def handle_disconnect(self, conn: ClientConnection):
         """Handle a client disconnection"""
-        logger.info(f"Client {client_addr} disconnected")
+        logger.info("Client %s disconnected", conn.addr)
         
         # If this was the waiting player, clear waiting player
-        if self.waiting_player and self.waiting_player[0] == client_sock:
+        if self.waiting_player is conn:
             self.waiting_player = None
             return
             
         # Check if this client is in a game session
-        for session_id, session in list(self.sessions.items()):
-            if session.player1[0] == client_sock:
-                if session.player2:
-                    # Notify other player
-                    self.send_message(session.player2[0], {
-                        'type': 'opponent_disconnected',
-                        'message': 'Your opponent has disconnected'
-                    })
-                # Remove the session
-                del self.sessions[session_id]
-                break
-                
-            if session.player2 and session.player2[0] == client_sock:
-                # Notify other player
-                self.send_message(session.player1[0], {
-                    'type': 'opponent_disconnected',
-                    'message': 'Your opponent has disconnected'
-                })
-                # Remove the session
-                del self.sessions[session_id]
-                break
+        session = self.sessions.pop(conn.session_id, None)
+        if session is None:
+            return
+            
+        # Notify other player
+        other = session.player2 if conn.player_number == 1 else session.player1
+        if other:
+            other.session_id = other.player_number = None
+            self.send_frame(other, _OPPONENT_DISCONNECTED_FRAME)
 
 if __name__ == "__main__":
     server = TicTacToeServer()
@@ -0,0 +1,35 @@
+"""Message type codes shared by the game server and client.
+
+Messages carry their type as a small integer under the 't' key. The older
+string form ('type': 'update') is still understood when receiving, and the
+server adds it to what it sends so clients predating the codes keep working.
+"""
+
+from typing import Dict, Optional
+
+WELCOME = 0
+WAITING = 1
+GAME_START = 2
+UPDATE = 3
+GAME_END = 4
+ERROR = 5
+OPPONENT_DISCONNECTED = 6
+GAME_RESTART = 7
+MOVE = 8
+RESTART = 9
+
+TYPE_NAMES = ('welcome', 'waiting', 'game_start', 'update', 'game_end',
+              'error', 'opponent_disconnected', 'game_restart', 'move', 'restart')
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+
+def with_legacy_type(message: Dict) -> Dict:
+    """Add the legacy 'type' name alongside 't'; drop once no client reads 'type'"""
+    message['type'] = TYPE_NAMES[message['t']]
+    return message
+
+def message_code(message: Dict) -> Optional[int]:
+    """Return the integer type of a decoded message, accepting the legacy string form"""
+    code = message.get('t')
+    if code is None:
+        code = TYPE_CODES.get(message.get('type'))
+    return code
@@ -1,6 +1,7 @@
 import pygame
 import sys
 import logging
+from collections import OrderedDict
 from game_client import TicTacToeClient
 from game_manager import AIGameManager
 
@@ -27,17 +28,40 @@ CIRCLE_RADIUS = 60
 CIRCLE_WIDTH = 15
 X_WIDTH = 20
 SPACE = 55
+STATUS_RECT = pygame.Rect(0, HEIGHT-100, WIDTH, 100)
+BOARD_RECT = pygame.Rect(0, 0, BOARD_SIZE*SQUARE_SIZE, BOARD_SIZE*SQUARE_SIZE)
+STATUS_CACHE_SIZE = 32  # Rendered status bars kept, keyed by everything they display
+EVENT_WAIT_MS = 33  # Wake-up interval while an AI move is in flight, so a delayed move is applied on time
+FULL_UPDATE_AREA = WIDTH * HEIGHT // 2  # Dirty area past which one full update beats many rects
+REDRAW_EVENT = pygame.USEREVENT + 1  # Posted by game callbacks to wake the event wait
+# The window system dropped the window contents (uncovered, restored), so the next present must be full
+REPAINT_EVENTS = (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED)
+
+CELL_RECTS = [pygame.Rect((i % 3)*SQUARE_SIZE, (i // 3)*SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+              for i in range(9)]
+CELL_ORIGINS = [rect.topleft for rect in CELL_RECTS]
 
 class PygameTicTacToeGUI:
     def __init__(self):
         pygame.init()
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.DOUBLEBUF)
         pygame.display.set_caption('Tic Tac Toe - DRL Training')
         
         self.font = pygame.font.SysFont('Arial', 40)
         self.small_font = pygame.font.SysFont('Arial', 20)
         self.medium_font = pygame.font.SysFont('Arial', 30)
         
+        # X and O marks are drawn once and blitted into cells every frame
+        self.x_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA).convert_alpha()
+        pygame.draw.line(self.x_surface, HOT_PINK, (SPACE, SPACE),
+                         (SQUARE_SIZE-SPACE, SQUARE_SIZE-SPACE), X_WIDTH)
+        pygame.draw.line(self.x_surface, HOT_PINK, (SPACE, SQUARE_SIZE-SPACE),
+                         (SQUARE_SIZE-SPACE, SPACE), X_WIDTH)
+        self.o_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA).convert_alpha()
+        pygame.draw.circle(self.o_surface, PINK, (SQUARE_SIZE//2, SQUARE_SIZE//2),
+                           CIRCLE_RADIUS, CIRCLE_WIDTH)
+        self.cell_sprites = (None, self.x_surface, self.o_surface)  # Indexed by cell value
+        
         self.status_message = "Select game mode"
         self.can_make_move = False
         self.show_restart_button = False
@@ -46,6 +70,18 @@ class PygameTicTacToeGUI:
         self.client = None
         self.ai_manager = None
         self.show_training_button = False
+        
+        self.mode_selection_surface, self.mode_selection_buttons = self.build_mode_selection()
+        self.board_surface = self.build_board_background()
+        
+        self._status_cache = OrderedDict()
+        
+        # Dirty-rect bookkeeping: only changed cells and the status bar are pushed to the display
+        self._dirty = []
+        self._drawn_mode = None
+        self._drawn_board = None
+        self._drawn_status = None
+        self._needs_full_update = True
 
     def setup_online_mode(self):
         self.game_mode = 'online'
@@ -65,7 +101,7 @@ class PygameTicTacToeGUI:
 
     def setup_ai_mode(self):
         self.game_mode = 'ai'
-        self.ai_manager = AIGameManager()
+        self.ai_manager = AIGameManager(show_thinking_delay=True)
         self.ai_manager.register_callback('on_game_start', self.on_game_start)
         self.ai_manager.register_callback('on_update', self.on_update)
         self.ai_manager.register_callback('on_game_end', self.on_game_end)
@@ -74,105 +110,158 @@ class PygameTicTacToeGUI:
         self.status_message = "Playing against AI (Training OFF)"
         self.show_training_button = True
 
-    def draw_mode_selection(self):
-        self.screen.fill(LAVENDER)
+    def build_mode_selection(self):
+        """Render the static mode-selection screen once"""
+        surface = pygame.Surface((WIDTH, HEIGHT)).convert()
+        surface.fill(LAVENDER)
         title_text = self.font.render("Choose Game Mode", True, PURPLE)
         title_rect = title_text.get_rect(center=(WIDTH//2, 100))
-        self.screen.blit(title_text, title_rect)
+        surface.blit(title_text, title_rect)
         
         # Online button
         online_rect = pygame.Rect(WIDTH//2 - 150, 200, 300, 60)
-        pygame.draw.rect(self.screen, PINK, online_rect, border_radius=10)
+        pygame.draw.rect(surface, PINK, online_rect, border_radius=10)
         online_text = self.medium_font.render("Play Online", True, BLACK)
         online_text_rect = online_text.get_rect(center=online_rect.center)
-        self.screen.blit(online_text, online_text_rect)
+        surface.blit(online_text, online_text_rect)
         
         # AI button
         ai_rect = pygame.Rect(WIDTH//2 - 150, 300, 300, 60)
-        pygame.draw.rect(self.screen, PINK, ai_rect, border_radius=10)
+        pygame.draw.rect(surface, PINK, ai_rect, border_radius=10)
         ai_text = self.medium_font.render("Play Against AI", True, BLACK)
         ai_text_rect = ai_text.get_rect(center=ai_rect.center)
-        self.screen.blit(ai_text, ai_text_rect)
+        surface.blit(ai_text, ai_text_rect)
         
-        return {'online': online_rect, 'ai': ai_rect}
+        return surface, {'online': online_rect, 'ai': ai_rect}
+
+    def draw_mode_selection(self):
+        self.screen.blit(self.mode_selection_surface, (0, 0))
+        return self.mode_selection_buttons
 
-    def draw_lines(self):
+    def build_board_background(self):
+        """Render the empty board once; cells are repainted by blitting from it"""
+        surface = pygame.Surface((WIDTH, HEIGHT-100)).convert()
+        surface.fill(LAVENDER)
+        self.draw_lines(surface)
+        return surface
+
+    def draw_lines(self, surface):
         # Horizontal lines
-        pygame.draw.line(self.screen, PURPLE, (0, SQUARE_SIZE), (WIDTH, SQUARE_SIZE), LINE_WIDTH)
-        pygame.draw.line(self.screen, PURPLE, (0, 2*SQUARE_SIZE), (WIDTH, 2*SQUARE_SIZE), LINE_WIDTH)
+        pygame.draw.line(surface, PURPLE, (0, SQUARE_SIZE), (WIDTH, SQUARE_SIZE), LINE_WIDTH)
+        pygame.draw.line(surface, PURPLE, (0, 2*SQUARE_SIZE), (WIDTH, 2*SQUARE_SIZE), LINE_WIDTH)
         # Vertical lines
-        pygame.draw.line(self.screen, PURPLE, (SQUARE_SIZE, 0), (SQUARE_SIZE, HEIGHT-100), LINE_WIDTH)
-        pygame.draw.line(self.screen, PURPLE, (2*SQUARE_SIZE, 0), (2*SQUARE_SIZE, HEIGHT-100), LINE_WIDTH)
+        pygame.draw.line(surface, PURPLE, (SQUARE_SIZE, 0), (SQUARE_SIZE, HEIGHT-100), LINE_WIDTH)
+        pygame.draw.line(surface, PURPLE, (2*SQUARE_SIZE, 0), (2*SQUARE_SIZE, HEIGHT-100), LINE_WIDTH)
 
-    def draw_board(self):
-        board = None
+    def get_board(self):
+        # bytes() is a no-op for the client's received board and a snapshot of the AI manager's bytearray
         if self.game_mode == 'online' and self.client and self.client.game_state:
-            board = self.client.game_state['board']
+            return bytes(self.client.game_state['board'])
         elif self.game_mode == 'ai' and self.ai_manager and self.ai_manager.game_state:
-            board = self.ai_manager.game_state['board']
-        else:
+            return bytes(self.ai_manager.game_state['board'])
+        return None
+
+    def draw_board(self, board):
+        if board is None:
             return
             
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                index = row * 3 + col
-                if board[index] == 1:  # Player X
-                    pygame.draw.line(self.screen, HOT_PINK, 
-                                   (col*SQUARE_SIZE+SPACE, row*SQUARE_SIZE+SPACE),
-                                   (col*SQUARE_SIZE+SQUARE_SIZE-SPACE, row*SQUARE_SIZE+SQUARE_SIZE-SPACE), X_WIDTH)
-                    pygame.draw.line(self.screen, HOT_PINK,
-                                   (col*SQUARE_SIZE+SPACE, row*SQUARE_SIZE+SQUARE_SIZE-SPACE),
-                                   (col*SQUARE_SIZE+SQUARE_SIZE-SPACE, row*SQUARE_SIZE+SPACE), X_WIDTH)
-                elif board[index] == 2:  # Player O
-                    pygame.draw.circle(self.screen, PINK,
-                                     (col*SQUARE_SIZE+SQUARE_SIZE//2, row*SQUARE_SIZE+SQUARE_SIZE//2),
-                                     CIRCLE_RADIUS, CIRCLE_WIDTH)
+        cell_sprites = self.cell_sprites
+        for origin, value in zip(CELL_ORIGINS, board):
+            sprite = cell_sprites[value]
+            if sprite:
+                self.screen.blit(sprite, origin)
+
+    def get_status_key(self):
+        if self.ai_manager:
+            return (self.status_message, self.show_restart_button,
+                    self.ai_manager.training_mode, bool(self.ai_manager.ai.reward_history))
+        return (self.status_message, self.show_restart_button)
+
+    def mark_dirty(self, board, status_key):
+        """Queue the rects that changed since the last presented frame; returns (cells, status)"""
+        dirty_cells = []
+        if board != self._drawn_board:
+            for index in range(9):
+                if board is None or self._drawn_board is None or board[index] != self._drawn_board[index]:
+                    dirty_cells.append(index)
+                    self._dirty.append(CELL_RECTS[index])
+            self._drawn_board = board
+        status_dirty = status_key != self._drawn_status
+        if status_dirty:
+            self._dirty.append(STATUS_RECT)
+            self._drawn_status = status_key
+        return dirty_cells, status_dirty
+
+    def draw_cells(self, board, indices):
+        """Repaint only the given cells, grid lines included"""
+        for index in indices:
+            rect = CELL_RECTS[index]
+            self.screen.blit(self.board_surface, rect, rect)
+            sprite = self.cell_sprites[board[index]] if board else None
+            if sprite:
+                self.screen.blit(sprite, rect)
 
     def draw_status(self):
-        status_rect = pygame.Rect(0, HEIGHT-100, WIDTH, 100)
-        pygame.draw.rect(self.screen, PURPLE, status_rect)
+        key = self.get_status_key()
+        cached = self._status_cache.get(key)
+        if cached is None:
+            cached = self.render_status()
+            self._status_cache[key] = cached
+            if len(self._status_cache) > STATUS_CACHE_SIZE:
+                self._status_cache.popitem(last=False)
+        else:
+            self._status_cache.move_to_end(key)
+        surface, buttons = cached
+        self.screen.blit(surface, STATUS_RECT)
+        return buttons
+
+    def render_status(self):
+        """Render the status bar off-screen; button rects are returned in screen coordinates"""
+        surface = pygame.Surface(STATUS_RECT.size).convert()
+        surface.fill(PURPLE)
+        offset = (0, -STATUS_RECT.top)
         
         text_surface = self.font.render(self.status_message, True, WHITE)
         text_rect = text_surface.get_rect(center=(WIDTH//2, HEIGHT-70))
-        self.screen.blit(text_surface, text_rect)
+        surface.blit(text_surface, text_rect.move(offset))
         
         buttons = {}
         if self.show_restart_button:
             restart_rect = pygame.Rect(WIDTH//2-100, HEIGHT-40, 200, 30)
-            pygame.draw.rect(self.screen, PINK, restart_rect)
+            pygame.draw.rect(surface, PINK, restart_rect.move(offset))
             restart_text = self.small_font.render("RESTART GAME", True, BLACK)
             restart_text_rect = restart_text.get_rect(center=restart_rect.center)
-            self.screen.blit(restart_text, restart_text_rect)
+            surface.blit(restart_text, restart_text_rect.move(offset))
             buttons['restart'] = restart_rect
             
         if self.game_mode:
             back_rect = pygame.Rect(10, HEIGHT-40, 100, 30)
-            pygame.draw.rect(self.screen, HOT_PINK, back_rect)
+            pygame.draw.rect(surface, HOT_PINK, back_rect.move(offset))
             back_text = self.small_font.render("BACK", True, WHITE)
             back_text_rect = back_text.get_rect(center=back_rect.center)
-            self.screen.blit(back_text, back_text_rect)
+            surface.blit(back_text, back_text_rect.move(offset))
             buttons['back'] = back_rect
             
             if self.show_training_button:
                 # Training toggle button
                 train_rect = pygame.Rect(WIDTH-250, HEIGHT-40, 120, 30)
                 color = GREEN if self.ai_manager.training_mode else RED
-                pygame.draw.rect(self.screen, color, train_rect)
+                pygame.draw.rect(surface, color, train_rect.move(offset))
                 train_text = self.small_font.render("TRAIN", True, WHITE)
                 train_text_rect = train_text.get_rect(center=train_rect.center)
-                self.screen.blit(train_text, train_text_rect)
+                surface.blit(train_text, train_text_rect.move(offset))
                 buttons['train'] = train_rect
                 
                 # Visualization button
                 if self.ai_manager.ai.reward_history:
                     viz_rect = pygame.Rect(WIDTH-120, HEIGHT-40, 110, 30)
-                    pygame.draw.rect(self.screen, PURPLE, viz_rect)
+                    pygame.draw.rect(surface, PURPLE, viz_rect.move(offset))
                     viz_text = self.small_font.render("SHOW GRAPH", True, WHITE)
                     viz_text_rect = viz_text.get_rect(center=viz_rect.center)
-                    self.screen.blit(viz_text, viz_text_rect)
+                    surface.blit(viz_text, viz_text_rect.move(offset))
                     buttons['visualize'] = viz_rect
                 
-        return buttons
+        return surface, buttons
 
     def check_button_click(self, pos, buttons):
         for button_name, button_rect in buttons.items():
@@ -184,16 +273,11 @@ class PygameTicTacToeGUI:
         if not self.can_make_move:
             return False
             
-        x, y = pos
-        if y > HEIGHT-100:
-            return False
-            
-        col = x // SQUARE_SIZE
-        row = y // SQUARE_SIZE
-        position = row * 3 + col
-        
-        if row < 0 or row >= BOARD_SIZE or col < 0 or col >= BOARD_SIZE:
+        # One bounds test against the whole board replaces the per-axis row/column checks
+        if not BOARD_RECT.collidepoint(pos):
             return False
+        x, y = pos
+        position = (y // SQUARE_SIZE) * 3 + x // SQUARE_SIZE
             
         if self.game_mode == 'online' and self.client and self.client.game_state:
             if self.client.game_state['board'][position] == 0:
@@ -210,6 +294,7 @@ class PygameTicTacToeGUI:
             self.client.disconnect()
             self.client = None
         elif self.game_mode == 'ai' and self.ai_manager:
+            self.ai_manager.shutdown()
             self.ai_manager = None
             
         self.game_mode = None
@@ -219,24 +304,31 @@ class PygameTicTacToeGUI:
         self.player_number = None
         self.show_training_button = False
 
+    def request_redraw(self):
+        pygame.event.post(pygame.event.Event(REDRAW_EVENT))
+
     # Callback methods
     def on_connect(self):
         self.status_message = "Connected to server. Waiting for opponent..."
+        self.request_redraw()
 
     def on_waiting(self):
         self.status_message = "Waiting for an opponent..."
+        self.request_redraw()
 
     def on_game_start(self, player_number, game_state):
         self.player_number = player_number
         self.status_message = f"You are {'X' if player_number == 1 else 'O'}"
         self.can_make_move = (game_state['current_player'] == player_number)
         self.show_restart_button = False
+        self.request_redraw()
 
     def on_update(self, game_state):
         if self.game_mode == 'online':
             self.can_make_move = (game_state['current_player'] == self.player_number)
         elif self.game_mode == 'ai':
             self.can_make_move = (game_state['current_player'] == 1)
+        self.request_redraw()
 
     def on_game_end(self, winner, game_state):
         if winner == 3:
@@ -247,14 +339,17 @@ class PygameTicTacToeGUI:
             self.status_message = "You lost!"
         self.can_make_move = False
         self.show_restart_button = True
+        self.request_redraw()
 
     def on_error(self, error_msg):
         self.status_message = f"Error: {error_msg}"
+        self.request_redraw()
 
     def on_disconnect(self):
         self.status_message = "Disconnected from server"
         self.can_make_move = False
         self.show_restart_button = False
+        self.request_redraw()
 
     def on_game_restart(self, game_state):
         self.status_message = "Game restarted!"
@@ -263,27 +358,65 @@ class PygameTicTacToeGUI:
         elif self.game_mode == 'ai':
             self.can_make_move = (game_state['current_player'] == 1)
         self.show_restart_button = False
+        self.request_redraw()
 
     def run(self):
-        clock = pygame.time.Clock()
         running = True
+        mode_buttons = self.mode_selection_buttons
+        status_buttons = {}
         
         while running:
-            self.screen.fill(LAVENDER)
+            if self.game_mode == 'ai' and self.ai_manager:
+                self.ai_manager.poll_ai_move()
+            
+            if self.game_mode != self._drawn_mode:
+                self._drawn_mode = self.game_mode
+                self._drawn_board = self._drawn_status = None
+                self._needs_full_update = True
             
+            # Redraw only when something changed since the last presented frame
             if self.game_mode is None:
-                mode_buttons = self.draw_mode_selection()
+                if self._needs_full_update:
+                    mode_buttons = self.draw_mode_selection()
             else:
-                self.draw_lines()
-                self.draw_board()
-                status_buttons = self.draw_status()
+                # Snapshot state before drawing so a change made meanwhile is caught next frame
+                board = self.get_board()
+                dirty_cells, status_dirty = self.mark_dirty(board, self.get_status_key())
+                if self._needs_full_update:
+                    self.screen.blit(self.board_surface, (0, 0))
+                    self.draw_board(board)
+                    status_buttons = self.draw_status()
+                else:
+                    if dirty_cells:
+                        self.draw_cells(board, dirty_cells)
+                    if status_dirty:
+                        status_buttons = self.draw_status()
             
-            for event in pygame.event.get():
+            if self._dirty and not self._needs_full_update:
+                # A restart dirties every cell; past half the window a single full update is cheaper
+                if sum(rect.width * rect.height for rect in self._dirty) >= FULL_UPDATE_AREA:
+                    self._needs_full_update = True
+            if self._needs_full_update:
+                pygame.display.update()
+                self._needs_full_update = False
+            elif self._dirty:
+                pygame.display.update(self._dirty)
+            self._dirty.clear()
+            
+            # Sleep until input arrives or a callback posts REDRAW_EVENT; only an in-flight
+            # AI move needs a timeout, since its thinking delay ends without any event
+            ai_pending = self.game_mode == 'ai' and self.ai_manager and self.ai_manager.ai_thinking
+            events = [pygame.event.wait(EVENT_WAIT_MS if ai_pending else 0)]
+            events.extend(pygame.event.get())
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
                     if self.game_mode == 'online' and self.client:
                         self.client.disconnect()
                 
+                if event.type in REPAINT_EVENTS:
+                    self._needs_full_update = True
+                
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     mouse_pos = pygame.mouse.get_pos()
                     
@@ -311,9 +444,6 @@ class PygameTicTacToeGUI:
                             self.ai_manager.ai.plot_training()
                         else:
                             self.check_board_click(mouse_pos)
-            
-            pygame.display.update()
-            clock.tick(30)
         
         pygame.quit()
 
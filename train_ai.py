@@ -4,31 +4,41 @@ import os
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 import random
-import pickle
-from game_ai import TicTacToeAI
+from contextlib import nullcontext
+from multiprocessing import Pool
+from game_ai import TicTacToeAI, TRAINING_DATA_PATH
+from bitboard import winner_from_bits
+
+PARALLEL_EVAL_MIN_GAMES = 5000  # Below this, pool startup and shipping the Q-table cost more than the games
 
 class TicTacToeEnvironment:
     """Tic-Tac-Toe environment for training AI agents"""
     
     def __init__ (self):
-        self.board = [0] * 9
+        self.board = bytearray(9)
+        self.bits = [0, 0, 0]  # Per-player bitboards, indexed by player number
         self.current_player = 1
         self.game_active = True
         
     def reset(self):
         """Reset the game board to initial state"""
-        self.board = [0] * 9
+        self.board[:] = bytes(9)
+        self.bits = [0, 0, 0]
         self.current_player = 1
         self.game_active = True
-        return self.board.copy()
+        return self.board
         
     def step(self, position):
-        """Make a move and return the new state, reward, done"""
-        if not self.game_active or position < 0 or position > 8 or self.board[position] != 0:
-            return self.board.copy(), -1, True  # Invalid move, penalize
+        """Make a move and return the new state, reward, done and the check_winner() result.
+        The state is the environment's own board, updated in place; copy it to keep a snapshot.
+        """
+        mask = 1 << position if 0 <= position <= 8 else 0
+        if not self.game_active or not mask or (self.bits[1] | self.bits[2]) & mask:
+            return self.board, -1, True, 0  # Invalid move, penalize
             
         # Make the move
         self.board[position] = self.current_player
+        self.bits[self.current_player] |= mask
         
         # Check for winner
         winner = self.check_winner()
@@ -36,15 +46,15 @@ class TicTacToeEnvironment:
             # Game ended
             self.game_active = False
             if winner == 3:  # Draw
-                return self.board.copy(), 0.5, True
+                return self.board, 0.5, True, winner
             elif winner == self.current_player:  # Win
-                return self.board.copy(), 1, True
+                return self.board, 1, True, winner
             else:  # Lose (shouldn't happen in this implementation)
-                return self.board.copy(), -1, True
+                return self.board, -1, True, winner
                 
         # Switch player
         self.current_player = 3 - self.current_player  # Toggle between 1 and 2
-        return self.board.copy(), 0, False  # Game continues
+        return self.board, 0, False, 0  # Game continues
         
     def check_winner(self):
         """Check if there's a winner or a draw
@@ -53,32 +63,12 @@ class TicTacToeEnvironment:
             1 or 2: Player number who won
             3: Draw
         """
-        # Check rows
-        for i in range(0, 9, 3):
-            if self.board[i] != 0 and self.board[i] == self.board[i+1] == self.board[i+2]:
-                return self.board[i]
-                
-        # Check columns
-        for i in range(3):
-            if self.board[i] != 0 and self.board[i] == self.board[i+3] == self.board[i+6]:
-                return self.board[i]
-                
-        # Check diagonals
-        if self.board[0] != 0 and self.board[0] == self.board[4] == self.board[8]:
-            return self.board[0]
-            
-        if self.board[2] != 0 and self.board[2] == self.board[4] == self.board[6]:
-            return self.board[2]
-            
-        # Check for draw (board full)
-        if 0 not in self.board:
-            return 3
-            
-        return 0  # Game continues
+        return winner_from_bits(self.bits[1], self.bits[2])
 
     def get_valid_moves(self):
         """Get all valid moves (empty positions)"""
-        return [i for i, val in enumerate(self.board) if val == 0]
+        occupied = self.bits[1] | self.bits[2]
+        return [i for i in range(9) if not occupied >> i & 1]
     
     def render(self):
         """Render the board to console"""
@@ -97,29 +87,28 @@ class SelfPlayTrainer:
         self.env = TicTacToeEnvironment()
         self.ai = TicTacToeAI()
         self.opponent_ai = TicTacToeAI()
+        # Self-play episodes are applied to the Q-table in batches; save_ai flushes what is left
+        self.ai.update_batch_size = 32
         
         # Try to load existing AI if available
         self.load_ai()
         
     def load_ai(self):
         """Load existing AI Q-table if available"""
-        if os.path.exists('ai_qtable.pkl'):
-            try:
-                with open('ai_qtable.pkl', 'rb') as f:
-                    self.ai.q_table = pickle.load(f)
+        try:
+            if self.ai.load_q_table():
                 print("Loaded existing AI Q-table")
                 
                 # Copy to opponent for more competitive self-play
-                self.opponent_ai.q_table = dict(self.ai.q_table)
+                self.opponent_ai.copy_q_table_from(self.ai)
                 self.opponent_ai.epsilon = 0.2  # More exploitation for opponent
                 
-            except Exception as e:
-                print(f"Error loading AI Q-table: {e}")
+        except Exception as e:
+            print(f"Error loading AI Q-table: {e}")
     
     def save_ai(self):
         """Save the AI Q-table"""
-        with open('ai_qtable.pkl', 'wb') as f:
-            pickle.dump(self.ai.q_table, f)
+        self.ai.save_q_table()
             
         # Also save the training data for visualization
         self.ai.save_training_data()
@@ -132,10 +121,10 @@ class SelfPlayTrainer:
         win_count = 0
         draw_count = 0
         loss_count = 0
-        win_rates = []
+        win_rates = np.empty(self.num_episodes // self.save_interval, dtype=np.float32)  # One entry per save interval
         
-        # Use tqdm for progress bar
-        for episode in tqdm(range(1, self.num_episodes + 1)):
+        # Use tqdm for progress bar, refreshed at most once a second and once per save interval
+        for episode in tqdm(range(1, self.num_episodes + 1), mininterval=1.0, miniters=self.save_interval):
             state = self.env.reset()
             done = False
             
@@ -148,18 +137,14 @@ class SelfPlayTrainer:
                     action = self.opponent_ai.make_move(state, 2)
                 
                 # Take action
-                next_state, reward, done = self.env.step(action)
-                
-                # Record to move history for the AI agent
-                if self.env.current_player == 2:  # Just moved with player 1 (main AI)
-                    pass  # The move is already recorded in make_move()
+                next_state, reward, done, winner = self.env.step(action)
                 
                 # Game ended, update Q-values only if main AI played last
                 if done:
-                    if self.env.check_winner() == 1:  # Main AI won
+                    if winner == 1:  # Main AI won
                         self.ai.update_q_values(1)
                         win_count += 1
-                    elif self.env.check_winner() == 2:  # Opponent won
+                    elif winner == 2:  # Opponent won
                         self.ai.update_q_values(-1)
                         loss_count += 1
                     else:  # Draw
@@ -171,6 +156,7 @@ class SelfPlayTrainer:
             
             # Occasionally save AI progress and print stats
             if episode % self.save_interval == 0:
+                self.ai.flush_q_updates()
                 win_rate = win_count / self.save_interval * 100
                 draw_rate = draw_count / self.save_interval * 100
                 loss_rate = loss_count / self.save_interval * 100
@@ -178,9 +164,9 @@ class SelfPlayTrainer:
                 print(f"\nEpisode {episode}/{self.num_episodes}")
                 print(f"Win Rate: {win_rate:.2f}%, Draw Rate: {draw_rate:.2f}%, Loss Rate: {loss_rate:.2f}%")
                 print(f"Exploration rate (epsilon): {self.ai.epsilon:.4f}")
-                print(f"Q-table size: {len(self.ai.q_table)} states")
+                print(f"Q-table size: {self.ai.state_count()} states")
                 
-                win_rates.append(win_rate)
+                win_rates[episode // self.save_interval - 1] = win_rate
                 win_count, draw_count, loss_count = 0, 0, 0
                 
                 # Save AI
@@ -188,7 +174,7 @@ class SelfPlayTrainer:
                 
                 # Update opponent AI with current knowledge but keep higher exploration
                 if episode > self.num_episodes // 2:
-                    self.opponent_ai.q_table = dict(self.ai.q_table)
+                    self.opponent_ai.copy_q_table_from(self.ai)
                     self.opponent_ai.epsilon = max(0.1, self.ai.epsilon + 0.1)
         
         # Final save
@@ -212,44 +198,70 @@ class SelfPlayTrainer:
         """Evaluate the trained AI against a random player"""
         print("\nEvaluating AI against random player...")
         
-        # Set epsilon to 0 for pure exploitation during evaluation
-        original_epsilon = self.ai.epsilon
-        self.ai.epsilon = 0
-        
         win_count = 0
         draw_count = 0
         loss_count = 0
         
-        for _ in tqdm(range(num_games)):
-            state = self.env.reset()
-            done = False
-            
-            while not done:
-                if self.env.current_player == 1:  # AI's turn
-                    action = self.ai.make_move(state, 1)
-                else:  # Random player
-                    valid_moves = self.env.get_valid_moves()
-                    action = random.choice(valid_moves) if valid_moves else -1
-                
-                state, _, done = self.env.step(action)
+        self.ai.flush_q_updates()
+        cpu_count = os.cpu_count() or 1
+        if cpu_count > 1 and num_games >= PARALLEL_EVAL_MIN_GAMES:
+            # Games are independent, so large evaluations are spread over one worker process per core
+            pool = Pool(initializer=_init_eval_worker, initargs=(self.ai.q_table,))
+            winners = pool.imap_unordered(_play_eval_game, range(num_games), max(1, num_games // (4 * cpu_count)))
+        else:
+            pool = nullcontext()
+            eval_ai = _make_eval_ai(self.ai.q_table)
+            winners = (_play_greedy_game(self.env, eval_ai) for _ in range(num_games))
             
-            # Check result
-            winner = self.env.check_winner()
-            if winner == 1:  # AI won
-                win_count += 1
-            elif winner == 2:  # Random player won
-                loss_count += 1
-            else:  # Draw
-                draw_count += 1
+        with pool:
+            for winner in tqdm(winners, total=num_games, mininterval=1.0):
+                if winner == 1:  # AI won
+                    win_count += 1
+                elif winner == 2:  # Random player won
+                    loss_count += 1
+                else:  # Draw
+                    draw_count += 1
         
         # Report results
         print(f"\nEvaluation results against random player (over {num_games} games):")
         print(f"Win Rate: {win_count/num_games*100:.2f}%")
         print(f"Draw Rate: {draw_count/num_games*100:.2f}%")
         print(f"Loss Rate: {loss_count/num_games*100:.2f}%")
+
+def _make_eval_ai(q_table):
+    """An agent that reads q_table without copying it and always plays its best move"""
+    ai = TicTacToeAI()
+    ai.set_q_table(q_table)
+    ai.epsilon = 0  # Pure exploitation during evaluation
+    return ai
+
+def _init_eval_worker(q_table):
+    """Pool initializer: give each evaluation worker its own environment and greedy agent"""
+    global _eval_env, _eval_ai
+    random.seed()  # Forked workers would otherwise all replay the parent's random sequence
+    _eval_env = TicTacToeEnvironment()
+    _eval_ai = _make_eval_ai(q_table)
+
+def _play_eval_game(_):
+    """Pool task: play one evaluation game with this worker's environment and agent"""
+    return _play_greedy_game(_eval_env, _eval_ai)
+
+def _play_greedy_game(env, ai):
+    """Play one game of the greedy AI against a random player and return the winner"""
+    state = env.reset()
+    done = False
+    
+    while not done:
+        if env.current_player == 1:  # AI's turn
+            action = ai.make_move(state, 1)
+        else:  # Random player
+            valid_moves = env.get_valid_moves()
+            action = random.choice(valid_moves) if valid_moves else -1
         
-        # Restore original epsilon
-        self.ai.epsilon = original_epsilon
+        state, _, done, winner = env.step(action)
+    
+    ai.move_history = []  # Evaluation never learns, so drop the recorded moves
+    return winner
 
 def main():
     # Parse command line arguments
@@ -274,7 +286,7 @@ def main():
         trainer.evaluate()
     
     # Plot training rewards
-    if os.path.exists('ai_training_data.pkl'):
+    if os.path.exists(TRAINING_DATA_PATH):
         from visulisation import plot_episode_rewards
         print("Generating training rewards plot...")
         plot_episode_rewards()
@@ -1,28 +1,83 @@
+import os
+import sys
+import matplotlib
+
+# With no display server there is no window to show; render off-screen and keep the saved image
+HEADLESS = sys.platform.startswith('linux') and not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+if HEADLESS:
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
 import pickle
 import numpy as np
-import os
+from game_ai import TRAINING_DATA_PATH, LEGACY_TRAINING_DATA_PATH
+
+SCATTER_MAX_POINTS = 5000  # Beyond this the per-episode points overlap; plot an even sample instead
+HEXBIN_MIN_POINTS = 20000  # Beyond this, show reward density as hexagonal bins rather than points
+REWARDS_PLOT_PATH = 'training_rewards.png'
+
+def find_training_data():
+    """Return the path of the saved reward history, preferring .npy over the legacy pickle"""
+    for path in (TRAINING_DATA_PATH, LEGACY_TRAINING_DATA_PATH):
+        if os.path.exists(path):
+            return path
+    return None
+
+def load_episode_rewards():
+    """Return the saved reward history, or None if there is none.
+    The .npy file is memory-mapped; the pickle written by older versions is still read.
+    """
+    path = find_training_data()
+    if path == TRAINING_DATA_PATH:
+        return np.load(path, mmap_mode='r')
+    if path == LEGACY_TRAINING_DATA_PATH:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    return None
 
 def plot_episode_rewards():
-    if not os.path.exists('ai_training_data.pkl'):
+    path = find_training_data()
+    if path is None:
         print("No training data found. Play some games with training enabled first.")
         return
     
-    with open('ai_training_data.pkl', 'rb') as f:
-        rewards = pickle.load(f)
+    # Headless runs only produce the image, so one newer than the data has nothing left to add
+    if HEADLESS and os.path.exists(REWARDS_PLOT_PATH) and \
+            os.path.getmtime(REWARDS_PLOT_PATH) >= os.path.getmtime(path):
+        print(f"{REWARDS_PLOT_PATH} is up to date.")
+        return
+    
+    rewards = load_episode_rewards()
+    
+    # The saved history is already float32, so this is the memory-mapped file itself, not a copy
+    values = np.asarray(rewards, dtype=np.float32)
     
-    plt.figure(figsize=(12, 6))
+    # Constrained layout is solved as part of drawing, replacing a separate tight_layout pass
+    fig = plt.figure(figsize=(12, 6), constrained_layout=True)
     
     # Create episode numbers
-    episodes = np.arange(1, len(rewards) + 1)
+    episodes = np.arange(1, len(values) + 1)
     
     # Plot raw rewards
-    plt.scatter(episodes, rewards, alpha=0.3, label='Per-Episode Reward')
+    if len(values) > HEXBIN_MIN_POINTS:
+        # Rewards take only a few distinct values, so a handful of rows of bins covers them
+        plt.hexbin(episodes, values, gridsize=(200, 8), cmap='Blues', mincnt=1)
+        plt.colorbar(label='Episodes per bin')
+    else:
+        if len(values) > SCATTER_MAX_POINTS:
+            sample = np.linspace(0, len(values) - 1, SCATTER_MAX_POINTS).astype(np.int64)
+        else:
+            sample = slice(None)
+        # Rasterized, edgeless markers: one bitmap for the whole artist instead of a vector path per point
+        plt.scatter(episodes[sample], values[sample], alpha=0.3, edgecolors='none', rasterized=True,
+                    label='Per-Episode Reward')
     
     # Plot moving average
     window_size = 50
-    moving_avg = [np.mean(rewards[max(0, i-window_size):i+1]) 
-                 for i in range(len(rewards))]
+    # Each trailing window is a difference of two prefix sums instead of a fresh mean
+    cumsum = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))  # float64 accumulator keeps long sums exact
+    starts = np.maximum(0, episodes - 1 - window_size)
+    moving_avg = ((cumsum[episodes] - cumsum[starts]) / (episodes - starts)).astype(np.float32)
     
     plt.plot(episodes, moving_avg, color='red', 
             label=f'{window_size}-Episode Moving Average')
@@ -31,9 +86,12 @@ def plot_episode_rewards():
     plt.xlabel('Episode Number')
     plt.ylabel('Reward')
     plt.legend()
-    plt.grid(True)
-    plt.tight_layout()
-    plt.show()
+    plt.grid(True, which='major', linewidth=0.4)
+    plt.savefig(REWARDS_PLOT_PATH, dpi=120)
+    if HEADLESS:
+        plt.close(fig)
+    else:
+        plt.show()
 
 if __name__ == "__main__":
     plot_episode_rewards()